@@ -4,15 +4,20 @@
 import argparse
 import configparser
 import gzip
+import hashlib
 import io
 import json
 import logging
+import math
 import os
+import random
 import re
 import statistics
 import sys
 from collections import deque, namedtuple
 from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
 from string import Template
 from typing import Callable, Iterable
 
@@ -28,12 +33,37 @@ config = {
     'LOG_DIR': './log',
     'LOGFILE': None,
     'LOGLEVEL': 10,
-    'ERRORS_LIMIT': None
+    'ERRORS_LIMIT': None,
+    'FAST_MODE': False,
+    'SAMPLE_SIZE': 100000,
+    'SAMPLE_STEP': 100,
+    'SAMPLE_BYTES': 256 * 1024 * 1024,
+    'SERIES_SIZE': 10,
+    'SERIES_BUCKET': 'hour'
 
 }
 
-# Record(href: str, request_time: str)
-Record = namedtuple('Record', ['href', 'request_time'])
+# Record(href: str, request_time: str, time_local: str)
+Record = namedtuple(
+    'Record', ['href', 'request_time', 'time_local'], defaults=[None]
+    )
+
+# LogSample(records: deque of Record, weights: deque of float,
+#           lines: int, total_lines: float, correction: float,
+#           read_share: float or None, unique_hrefs: int,
+#           unique_in_log: bool)
+# where weights[i] is the number of log lines records[i] stands for,
+# lines is the number of sampled lines, total_lines is the (estimated)
+# number of lines in the whole log, correction is the finite population
+# correction for the variance (0 if every line is sampled), read_share
+# is the share of the file read from its start by the every-Nth-line
+# sampling (None for random offsets) and unique_in_log is True if
+# every log line was sampled, so unique_hrefs covers the whole log
+LogSample = namedtuple(
+    'LogSample', ['records', 'weights', 'lines', 'total_lines',
+                  'correction', 'read_share', 'unique_hrefs',
+                  'unique_in_log']
+    )
 
 # DateNamedFileInfo(file_path: str, file_date: datetime.datetime object)
 DateNamedFileInfo = namedtuple(
@@ -41,6 +71,79 @@ DateNamedFileInfo = namedtuple(
     )
 
 
+class HyperLogLog:
+    '''
+    Cardinality sketch: estimates the number of unique values
+    keeping 2 ** precision small registers instead of the values
+    themselves. Standard error is about 1.04 / sqrt(2 ** precision),
+    i.e. ~1.6% for the default precision.
+    '''
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value: str or bytes) -> None:
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        digest = hashlib.blake2b(value, digest_size=8)
+        hashed = int.from_bytes(digest.digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def __len__(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class QuantileSketch:
+    '''
+    Quantile sketch with relative accuracy: values are counted in
+    logarithmic bins, so any quantile is returned within
+    relative_accuracy of the true value using a few hundred bins
+    instead of keeping every value.
+    '''
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float, weight: float = 1) -> None:
+        self.count += weight
+        if value <= 0:
+            self.zeros += weight
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + weight
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+
 def load_conf(conf_path: str) -> dict:
     '''
     Loading config
@@ -141,9 +244,18 @@ def is_gzip_file(file_path: str) -> bool:
     return file_path.split('.')[-1] == 'gz'
 
 
+def is_true(value) -> bool:
+    '''
+    Interpret config value (bool or string from config file) as bool
+    '''
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
 def parse_log_record(log_line: str) -> Record or None:
     '''
-    Parse given log line, get its URL and request time
+    Parse given log line, get its URL, request time and local time
     and give away in a namedtuple Record.
     '''
     r = LOG_RECORD_RE
@@ -151,7 +263,84 @@ def parse_log_record(log_line: str) -> Record or None:
     if match:
         href = match.group('href')
         request_time = match.group('time')
-        return Record(href=href, request_time=request_time)
+        time_local = match.group('time_local')
+        return Record(href=href, request_time=request_time,
+                      time_local=time_local)
+
+
+# time_local prefix length and its format for every bucket size,
+# i.e. "29/Jun/2017:10:46" for a minute
+TIME_BUCKETS = {
+    'minute': (17, '%d/%b/%Y:%H:%M%z'),
+    'hour': (14, '%d/%b/%Y:%H%z'),
+}
+
+
+@lru_cache(maxsize=4096)
+def _parse_time_bucket(prefix: str, timezone: str, time_format: str) -> str:
+    return datetime.strptime(prefix + timezone, time_format).isoformat()
+
+
+def time_bucket(time_local: str, bucket: str = 'hour') -> str:
+    '''
+    Return the start of the minute or hour of given nginx time_local
+    (i.e. "29/Jun/2017:10:46:03 +0300") in ISO format. strptime is
+    called once per distinct bucket, the rest are taken from cache.
+    '''
+    size, time_format = TIME_BUCKETS[bucket]
+    return _parse_time_bucket(time_local[:size], time_local[-5:], time_format)
+
+
+def parse_line(line: bytes,
+               parser: Callable = parse_log_record) -> Record or None:
+    '''
+    Decode and parse raw log line, return None if it cannot be parsed
+    '''
+    try:
+        return parser(line.decode('utf-8'))
+    except Exception as exc:
+        logging.info('Cannot parse line: %s' % exc)
+
+
+def check_errors_limit(records: int, errors: int,
+                       errors_limit: int = None) -> None:
+    '''
+    Raise RuntimeError if share of unparsed lines exceeds errors_limit
+    '''
+    if errors_limit and all((
+        records > 0,
+        (errors / float(records or 1)) > float(errors_limit)
+    )):
+        raise RuntimeError('Errors limit exceeded')
+
+
+def collect_records(
+        lines: Iterable[bytes],
+        errors_limit: int = None,
+        parser: Callable = parse_log_record) -> tuple[deque, HyperLogLog]:
+    '''
+    Parse given raw log lines, return a deque with parsed records
+    and a HyperLogLog sketch with their hrefs.
+    '''
+    errors = 0
+    records = 0
+    result = deque()
+    hrefs = HyperLogLog()
+    for line in lines:
+        rec = parse_line(line, parser)
+        if rec:
+            result.append(rec)
+            records += 1
+            hrefs.add(rec.href)
+        else:
+            errors += 1
+
+    check_errors_limit(records, errors, errors_limit)
+
+    logging.debug(f'Total records found: {records}, unique: ~{len(hrefs)}')
+    logging.debug(f'Resulting list length: {len(result)}')
+    logging.debug(f'Total errors occurred: {errors}')
+    return result, hrefs
 
 
 def get_log_records(
@@ -163,40 +352,258 @@ def get_log_records(
     records. Using fast deque() instead of simple list.
     '''
     open_fn = gzip.open if is_gzip_file(log_path) else io.open
-    errors = 0
-    records = 0
-    result = deque()
-    _hrefs = set()
     with open_fn(log_path, mode='rb') as log_file:
-        for line in log_file:
-            try:
-                rec = parser(line.decode('utf-8'))
-            except Exception as exc:
-                logging.info('Cannot parse line: %s' % exc)
-            if rec:
-                result.append(rec)
-                records += 1
-                _hrefs.add(rec.href)
-            else:
-                errors += 1
-
-    if errors_limit and all(
-        records > 0,
-        (errors / float(records)) > float(errors_limit)
-    ):
-        raise RuntimeError('Errors limit exceeded')
-
-    logging.debug(f'Total records found: {records}, unique: {len(_hrefs)}')
-    logging.debug(f'Resulting list length: {len(result)}')
-    logging.debug(f'Total errors occurred: {errors}')
+        result, _ = collect_records(log_file, errors_limit, parser)
     return result
 
 
+def _line_start(log_file: io.BufferedReader, offset: int,
+                chunk_size: int = 4096) -> int:
+    '''
+    Scan back from offset to the previous newline and return
+    the position of the line containing offset
+    '''
+    position = offset
+    while position > 0:
+        begin = max(0, position - chunk_size)
+        log_file.seek(begin)
+        newline = log_file.read(position - begin).rfind(b'\n')
+        if newline != -1:
+            return begin + newline + 1
+        position = begin
+    return 0
+
+
+def _lines_at_random_offsets(log_file: io.BufferedReader,
+                             file_size: int,
+                             sample_size: int,
+                             rnd: random.Random) -> Iterable[bytes]:
+    '''
+    Seek to sample_size random offsets in the file and yield the line
+    containing every offset. A line is picked with probability
+    len(line) / file_size, lines hit more than once are yielded
+    (as the same object) every time.
+    '''
+    offsets = sorted(rnd.randrange(file_size) for _ in range(sample_size))
+    line = b''
+    line_end = 0
+    for offset in offsets:
+        if offset >= line_end:
+            line_start = _line_start(log_file, offset)
+            log_file.seek(line_start)
+            line = log_file.readline()
+            line_end = line_start + len(line)
+        yield line
+
+
+def sample_log_records(
+        log_path: str,
+        sample_size: int = None,
+        sample_step: int = 100,
+        sample_bytes: int = None,
+        errors_limit: int = None,
+        parser: Callable = parse_log_record,
+        seed: int = None) -> LogSample:
+    '''
+    Parse only a sample of the log lines for a quick approximate report.
+
+    Plain files are sampled by seeking to sample_size random offsets
+    and taking the line that contains each offset, so long lines are
+    picked more often. Every sampled line is weighted by
+    file_size / (sample_size * len(line)) to make the estimates
+    unbiased. Gzipped files cannot be seeked cheaply, so for them
+    (or if sample_size is not set) every sample_step-th line is parsed
+    and the rest are only counted. Reading stops after sample_bytes
+    of (uncompressed) log data, the total number of lines is then
+    extrapolated from the position reached in the file on disk.
+
+    Only the sampled lines are fed to the HyperLogLog sketch, so
+    unique_hrefs is a lower bound for the whole log unless every
+    line has been sampled.
+    '''
+    sample_size = int(sample_size or 0)
+    sample_step = int(sample_step or 1)
+    sample_bytes = int(sample_bytes or 0)
+    read_share = None
+
+    if sample_size and not is_gzip_file(log_path):
+        file_size = os.path.getsize(log_path)
+        with io.open(log_path, mode='rb') as log_file:
+            lines = list(_lines_at_random_offsets(
+                log_file, file_size, sample_size, random.Random(seed)
+            )) if file_size else []
+        line_weights = [
+            file_size / (len(lines) * len(line)) for line in lines
+        ]
+        total_lines = sum(line_weights)
+        # offsets are drawn with replacement
+        correction = 1.0
+    else:
+        file_size = os.path.getsize(log_path)
+        lines = []
+        read_lines = 0
+        with io.open(log_path, mode='rb') as raw_file:
+            log_file = (
+                gzip.GzipFile(fileobj=raw_file, mode='rb')
+                if is_gzip_file(log_path) else raw_file
+            )
+            for line in log_file:
+                if read_lines % sample_step == 0:
+                    lines.append(line)
+                read_lines += 1
+                # checking the position once in a while
+                # is enough to keep the budget
+                if (sample_bytes and read_lines % 1000 == 0
+                        and log_file.tell() >= sample_bytes):
+                    break
+            position = raw_file.tell()
+
+        read_share = min(1.0, position / file_size) if file_size else 1.0
+        if read_share < 1:
+            total_lines = read_lines / read_share
+            # the rest of the log is extrapolated, no correction
+            correction = 1.0
+        else:
+            total_lines = read_lines
+            correction = 1 - len(lines) / total_lines if total_lines else 0.0
+        line_weights = (
+            [total_lines / len(lines)] * len(lines) if lines else []
+        )
+
+    hrefs = HyperLogLog()
+    records = deque()
+    weights = deque()
+    errors = 0
+    last_line = rec = None
+    for line, weight in zip(lines, line_weights):
+        # repeated hits of one line are the same object
+        if line is not last_line:
+            rec = parse_line(line, parser)
+            last_line = line
+        if rec:
+            records.append(rec)
+            weights.append(weight)
+            hrefs.add(rec.href)
+        else:
+            errors += 1
+    check_errors_limit(len(records), errors, errors_limit)
+
+    logging.debug(
+        f'Sampled {len(lines)} lines of ~{round(total_lines)}'
+    )
+    return LogSample(
+        records=records,
+        weights=weights,
+        lines=len(lines),
+        total_lines=total_lines,
+        correction=correction,
+        read_share=read_share,
+        unique_hrefs=len(hrefs),
+        unique_in_log=read_share == 1 and sample_step == 1
+    )
+
+
+def _weighted_sums(sample: LogSample) -> dict:
+    '''
+    Sum weights of the sampled records (and their squares) per href
+    '''
+    sums = {}
+    for (href, response_time, _), weight in zip(sample.records,
+                                                sample.weights):
+        response_time = float(response_time)
+        if href not in sums:
+            sums[href] = dict(
+                count=0, count_sq=0, time_sum=0, time_sq=0, times=[]
+            )
+        dct = sums[href]
+        dct['count'] += weight
+        dct['count_sq'] += weight ** 2
+        dct['time_sum'] += weight * response_time
+        dct['time_sq'] += (weight * response_time) ** 2
+        dct['times'].append((response_time, weight))
+    return sums
+
+
+def _error_bound(estimate: float, sq_sum: float, sample: LogSample) -> float:
+    '''
+    95% error bound of a weighted estimate (sum of weight * value
+    over the sample), sq_sum is the sum of (weight * value) ** 2
+    '''
+    n = sample.lines
+    if n < 2:
+        return 0
+    variance = max(0.0, n * sq_sum - estimate ** 2) / (n - 1)
+    return 1.96 * math.sqrt(sample.correction * variance)
+
+
+def _weighted_median(values: list[tuple[float, float]]) -> float:
+    '''
+    Median of (value, weight) pairs
+    '''
+    values = sorted(values)
+    half = sum(weight for _, weight in values) / 2
+    seen = 0
+    for value, weight in values:
+        seen += weight
+        if seen >= half:
+            return value
+    return 0
+
+
+def _add_estimates(dct: dict, sums: dict, sample: LogSample,
+                   total_count: float, total_time: float) -> None:
+    '''
+    Replace sampled count, time_sum and their derivatives in a report
+    row with the weighted estimates for the whole log, add 95% error
+    bounds (count_err and time_sum_err).
+    '''
+    count = sums['count']
+    time_sum = sums['time_sum']
+    dct['count'] = round(count)
+    dct['count_err'] = round(_error_bound(count, sums['count_sq'], sample))
+    dct['count_perc'] = round(count / total_count * 100, 5)
+    dct['time_sum'] = round(time_sum, 3)
+    dct['time_sum_err'] = round(
+        _error_bound(time_sum, sums['time_sq'], sample), 3)
+    dct['time_perc'] = round(time_sum / total_time * 100, 5)
+    dct['time_avg'] = round(time_sum / count, 5)
+    dct['time_med'] = round(_weighted_median(sums['times']), 5)
+
+
+def describe_sample(sample: LogSample) -> str:
+    '''
+    Human-readable note for the report built from a sample
+    '''
+    if sample.unique_in_log:
+        unique = f'Unique URLs in the log: ~{sample.unique_hrefs}.'
+    else:
+        unique = (
+            f'Unique URLs: at least ~{sample.unique_hrefs} '
+            '(counted in the sampled lines only, the log may have more).'
+        )
+    head = ''
+    if sample.read_share is not None and sample.read_share < 1:
+        head = (
+            f'Only the first {sample.read_share:.1%} of the file was read, '
+            'the estimates assume the rest of the log looks the same. '
+        )
+    return (
+        'APPROXIMATE REPORT: count, time_sum and their percentages are '
+        f'estimated from {sample.lines} sampled lines of '
+        f'~{round(sample.total_lines)} total, count_err and time_sum_err '
+        'are 95% error bounds, time_max is the maximum within the sample. '
+        + head + unique
+    )
+
+
 def create_report(records: Iterable,
-                  max_records: str or int) -> Iterable[dict]:
+                  max_records: str or int,
+                  sample: LogSample = None) -> Iterable[dict]:
     '''
     Analyze parsed records and create a list of all
-    URLs with data for the report
+    URLs with data for the report. If the records are a sample
+    (see sample_log_records), count and time_sum are extrapolated
+    to the whole log and error bounds are added.
     '''
     logging.info('Creating report, please wait...')
     max_records = int(max_records)
@@ -205,7 +612,7 @@ def create_report(records: Iterable,
     int_data = {}
     result = []
 
-    for href, response_time in records:
+    for href, response_time, _ in records:
         response_time = float(response_time)
         total_time += response_time
 
@@ -235,6 +642,10 @@ def create_report(records: Iterable,
                 pass
     # end for
 
+    if sample:
+        sums = _weighted_sums(sample)
+        total_count = sum(dct['count'] for dct in sums.values())
+        total_time = sum(dct['time_sum'] for dct in sums.values())
     for _, dct in int_data.items():
         dct['count_perc'] = round(
             (dct['count'] / total_records) * 100, 5)
@@ -249,6 +660,10 @@ def create_report(records: Iterable,
             statistics.median(dct['time_lst'] or [0]),
             5  # rounding precision
         )
+        if sample:
+            _add_estimates(
+                dct, sums[dct['url']], sample, total_count, total_time
+            )
         del dct['time_lst']
         result.append(dct)
 
@@ -259,17 +674,74 @@ def create_report(records: Iterable,
     return result[:max_records]
 
 
+def create_series(records: Iterable,
+                  urls: Iterable[str],
+                  bucket: str = 'hour',
+                  sample: LogSample = None) -> Iterable[dict]:
+    '''
+    Split requests to given URLs into minute or hour buckets and
+    count requests, their time sum and time quantiles in each bucket.
+    Records should be iterable once more after create_report.
+    If the records are a sample, count and time_sum are extrapolated
+    to the whole log, as in create_report.
+    '''
+    if bucket not in TIME_BUCKETS:
+        raise ValueError(f'Unknown time bucket: {bucket}')
+    urls = list(urls)
+    series = {url: {} for url in urls}
+    weights = sample.weights if sample else repeat(1)
+    for (href, response_time, time_local), weight in zip(records, weights):
+        if href not in series or not time_local:
+            continue
+        try:
+            key = time_bucket(time_local, bucket)
+        except ValueError:
+            logging.info(f'Cannot parse time_local: {time_local}')
+            continue
+        response_time = float(response_time)
+        buckets = series[href]
+        if key not in buckets:
+            buckets[key] = dict(
+                count=0, time_sum=0, sketch=QuantileSketch()
+            )
+        buckets[key]['count'] += weight
+        buckets[key]['time_sum'] += weight * response_time
+        buckets[key]['sketch'].add(response_time, weight)
+
+    result = []
+    for url in urls:
+        for key, dct in sorted(series[url].items()):
+            sketch = dct['sketch']
+            result.append(dict(
+                url=url,
+                bucket=key,
+                count=round(dct['count']),
+                time_sum=round(dct['time_sum'], 3),
+                time_p50=round(sketch.quantile(0.5), 5),
+                time_p95=round(sketch.quantile(0.95), 5),
+                time_p99=round(sketch.quantile(0.99), 5)
+            ))
+    return result
+
+
 def render_template(report: Iterable[dict],
                     report_file_path: str,
-                    template_path: str) -> None:
+                    template_path: str,
+                    report_note: str = '',
+                    series: Iterable[dict] = None) -> None:
     '''
     Render and write down ready report in html file
     '''
     json_report = json.dumps(report)
+    json_series = json.dumps(series or [])
     with open(template_path, mode='rb') as temp_file:
         contents = temp_file.read().decode('utf-8')
         t = Template(contents)
-        ready_report_contents = t.safe_substitute(table_json=json_report)
+        ready_report_contents = t.safe_substitute(
+            table_json=json_report,
+            series_json=json_series,
+            report_note=report_note
+        )
     with open(report_file_path, mode='w+') as ready_file:
         ready_file.writelines(ready_report_contents)
 
@@ -284,8 +756,12 @@ def main(config: dict) -> None:
         logging.info('No log files yet')
         return
 
+    fast_mode = is_true(config.get('FAST_MODE'))
     report_date_string = latest_log_info.file_date.strftime('%Y.%m.%d')
-    report_filename = 'report-{}.html'.format(report_date_string)
+    report_filename = 'report-{}{}.html'.format(
+        report_date_string,
+        '-fast' if fast_mode else ''
+    )
     report_file_path = os.path.join(
         config['REPORT_DIR'],
         report_filename
@@ -301,19 +777,43 @@ def main(config: dict) -> None:
     latest_path = os.path.normpath(latest_log_info.file_path)
     logging.info(
         f'Collecting data from "{latest_path}"')
-    log_records = get_log_records(
-        latest_log_info.file_path,
-        config.get('ERRORS_LIMIT')
-    )
+    sample = None
+    report_note = ''
+    if fast_mode:
+        sample = sample_log_records(
+            latest_log_info.file_path,
+            sample_size=config.get('SAMPLE_SIZE'),
+            sample_step=config.get('SAMPLE_STEP'),
+            sample_bytes=config.get('SAMPLE_BYTES'),
+            errors_limit=config.get('ERRORS_LIMIT')
+        )
+        log_records = sample.records
+        report_note = describe_sample(sample)
+        logging.info(report_note)
+    else:
+        log_records = get_log_records(
+            latest_log_info.file_path,
+            config.get('ERRORS_LIMIT')
+        )
     report_data = create_report(
         log_records,
-        config['REPORT_SIZE']
+        config['REPORT_SIZE'],
+        sample=sample
+    )
+    series_size = int(config.get('SERIES_SIZE') or 0)
+    series_data = create_series(
+        log_records,
+        [row['url'] for row in report_data[:series_size]],
+        bucket=config.get('SERIES_BUCKET') or 'hour',
+        sample=sample
     )
 
     render_template(
         report=report_data,
         report_file_path=report_file_path,
-        template_path=config['REPORT_TEMPLATE']
+        template_path=config['REPORT_TEMPLATE'],
+        report_note=report_note,
+        series=series_data
     )
 
     logging.info(
@@ -331,6 +831,10 @@ if __name__ == "__main__":
         '-c', '--config', help='Config file path',
         default='./config/config.ini'
     )
+    parser.add_argument(
+        '-f', '--fast', help='Approximate report from a sample of the log',
+        action='store_true'
+    )
     args = parser.parse_args()
 
     try:
@@ -346,6 +850,8 @@ if __name__ == "__main__":
         default_config=config,
         file_config=file_config
     )
+    if args.fast:
+        config['FAST_MODE'] = True
 
     setup_logger(
         config['LOGFILE'],
@@ -29,76 +29,164 @@
 # Можно свободно определять свои функции и т.п.
 # -----------------
 from collections import Counter
-from itertools import combinations
+from functools import reduce
+from itertools import combinations, product
+from operator import and_
 
 
 class Card:
-
-    # словарь перевода ranks в натуральные числа от 2 до 13
+    """
+    Карта колоды. Экземпляры не создаются на каждый вызов:
+    все 52 карты и 2 джокера заранее лежат в таблице DECK
+    и переиспользуются (flyweight), см. get_card и card_id.
+    """
+    __slots__ = ('id', 'rank', 'suit', 'ranknum', 'suitnum', 'bits')
+
+    # словарь перевода ranks в натуральные числа от 2 до 14
     rankdict = dict(
         zip(
             ([str(el) for el in range(2, 10)] + 'T J Q K A'.split()),
-            range(2, 14)
+            range(2, 15)
         )
     )
+    # масти в порядке их индексов; B и R - цвета джокеров
+    suits = 'CDHS'
+    joker_suits = 'BR'
 
     def __init__(self, rank: str, suit: str):
+        # id - индекс карты в DECK, задается в _build_deck
+        self.id = None
         self.rank = rank
         self.suit = suit
         self.ranknum = self._rank_as_number()
+        self.suitnum = self._suit_as_number()
+        self.bits = self._as_bits()
+
+    def __repr__(self):
+        return self.rank + self.suit
 
     def _rank_as_number(self) -> int:
-        return Card.rankdict[self.rank]
+        # у джокера ранга нет
+        return Card.rankdict.get(self.rank, 0)
+
+    def _suit_as_number(self) -> int:
+        if self.rank == '?':
+            return len(Card.suits) + Card.joker_suits.index(self.suit)
+        return Card.suits.index(self.suit)
+
+    def _as_bits(self) -> int:
+        """
+        Битовое представление: младшие 4 бита - масть,
+        бит (4 + ranknum) - ранг. У джокера битов масти нет.
+        """
+        if self.rank == '?':
+            return 0
+        return (1 << (4 + self.ranknum)) | (1 << self.suitnum)
+
+
+def _build_deck() -> tuple:
+    deck = [
+        Card(rank=rank, suit=suit)
+        for rank in Card.rankdict
+        for suit in Card.suits
+    ]
+    deck += [Card(rank='?', suit=suit) for suit in Card.joker_suits]
+    for i, card in enumerate(deck):
+        card.id = i
+    return tuple(deck)
+
+
+# все карты колоды, индекс в кортеже - id карты:
+# 0..51 - обычные карты, 52 - черный джокер '?B', 53 - красный '?R'
+DECK = _build_deck()
 
+# перевод строки вида 'TH' в id карты, строится один раз по DECK
+CARD_IDS = {repr(card): card.id for card in DECK}
 
-def get_cards(hand):
-    '''
-    Возвращает "руку" как набор объектов
-    '''
-    cards = [Card(rank=card[0], suit=card[1]) for card in hand]
-    return cards
+
+def card_id(card: str) -> int:
+    """Возвращает id карты по строке вида 'TH'"""
+    return CARD_IDS[card]
+
+
+def get_card(card) -> Card:
+    """
+    Возвращает карту из DECK. Принимает строку ('TH'),
+    id карты (int) или уже готовый объект Card
+    """
+    if isinstance(card, Card):
+        return card
+    if isinstance(card, int):
+        return DECK[card]
+    return DECK[card_id(card)]
+
+
+def parse_hand(hand) -> tuple[int]:
+    """Переводит "руку" в кортеж id карт"""
+    return tuple(get_card(card).id for card in hand)
 
 
 def hand_rank(hand):
-    """Возвращает значение определяющее ранг 'руки'"""
-    ranks = card_ranks(hand)
-    if straight(ranks) and flush(hand):
-        return (8, max(ranks))
-    elif kind(4, ranks):
-        return (7, kind(4, ranks), kind(1, ranks))
-    elif kind(3, ranks) and kind(2, ranks):
-        return (6, kind(3, ranks), kind(2, ranks))
-    elif flush(hand):
+    """Возвращает значение определяющее ранг 'руки'.
+    Карты могут быть заданы строками, id или объектами Card"""
+    # карты разбираются один раз: ранги собираются в список,
+    # а биты мастей - в общую маску (ненулевая маска - флеш)
+    ranks = []
+    suits = 0b1111
+    for card in hand:
+        card = get_card(card)
+        ranks.append(card.ranknum)
+        suits &= card.bits
+    ranks = _order_ranks(ranks)
+    counts = Counter(ranks)
+    is_straight = len(counts) == 5 and ranks[0] - ranks[4] == 4
+    if is_straight and suits:
+        return (8, ranks[0])
+    elif _kind(4, counts):
+        return (7, _kind(4, counts), _kind(1, counts))
+    elif _kind(3, counts) and _kind(2, counts):
+        return (6, _kind(3, counts), _kind(2, counts))
+    elif suits:
         return (5, ranks)
-    elif straight(ranks):
-        return (4, max(ranks))
-    elif kind(3, ranks):
-        return (3, kind(3, ranks), ranks)
-    elif two_pair(ranks):
-        return (2, two_pair(ranks), ranks)
-    elif kind(2, ranks):
-        return (1, kind(2, ranks), ranks)
+    elif is_straight:
+        return (4, ranks[0])
+    elif _kind(3, counts):
+        return (3, _kind(3, counts), ranks)
+    elif _two_pair(counts):
+        return (2, _two_pair(counts), ranks)
+    elif _kind(2, counts):
+        return (1, _kind(2, counts), ranks)
     else:
         return (0, ranks)
 
 
+def _order_ranks(ranks: list[int]) -> list[int]:
+    """Сортирует ранги от большего к меньшему, в A-2-3-4-5
+    туз считается младшей картой"""
+    ranks.sort(reverse=True)
+    if ranks == [14, 5, 4, 3, 2]:
+        return [5, 4, 3, 2, 1]
+    return ranks
+
+
 def card_ranks(hand) -> list[int]:
     """Возвращает список рангов (его числовой эквивалент),
     отсортированный от большего к меньшему"""
-    cards = get_cards(hand)
-    return sorted([card.ranknum for card in cards], reverse=True)
+    return _order_ranks([get_card(card).ranknum for card in hand])
 
 
 def flush(hand) -> bool:
     """Возвращает True, если все карты одной масти"""
-    cards = get_cards(hand)
-    suits = [card.suit for card in cards]
-    return True if len(set(suits)) == 1 else False
+    return bool(
+        reduce(and_, (get_card(card).bits for card in hand)) & 0b1111
+    )
 
 
 def straight(ranks) -> bool:
     """Возвращает True, если отсортированные ранги формируют последовательность
     5ти, где у 5ти карт ранги идут по порядку (стрит)"""
+    if sorted(ranks) == [2, 3, 4, 5, 14]:
+        return True
     bag = []
     for i, rank in enumerate(sorted(ranks)):
         if i == 0:
@@ -114,8 +202,11 @@ def straight(ranks) -> bool:
 def kind(n, ranks):
     """Возвращает первый ранг, который n раз встречается в данной руке.
     Возвращает None, если ничего не найдено"""
-    counter = dict(Counter(ranks))
-    for rank, count in counter.items():
+    return _kind(n, Counter(ranks))
+
+
+def _kind(n, counts):
+    for rank, count in counts.items():
         if count == n:
             return rank
     return
@@ -124,26 +215,29 @@ def kind(n, ranks):
 def two_pair(ranks):
     """Если есть две пары, то возврщает два соответствующих ранга,
     иначе возвращает None"""
-    first = kind(2, ranks)
-    if first:
-        [ranks.remove(first) for _ in range(2)]
-        second = kind(2, ranks)
-        if second:
-            return first, second
+    return _two_pair(Counter(ranks))
+
+
+def _two_pair(counts):
+    pairs = [rank for rank, count in counts.items() if count == 2]
+    if len(pairs) >= 2:
+        return pairs[0], pairs[1]
     return
 
 
 def best_hand(hand):
     """Из "руки" в 7 карт возвращает лучшую "руку" в 5 карт """
-    i = iter(combinations(hand, 5))
-    best_rank = 0, 0, 0
+    i = iter(combinations(parse_hand(hand), 5))
+    best_rank = None
     best_combination = None
     for combination in i:
         current_rank = hand_rank(combination)
-        if compare(current_rank, best_rank):
+        if best_combination is None or compare(current_rank, best_rank):
             best_rank = current_rank
             best_combination = combination
-    return best_combination
+    if best_combination is None:
+        return
+    return tuple(repr(DECK[card]) for card in best_combination)
 
 
 def compare(current_rank, best_rank):
@@ -173,7 +267,31 @@ def compare(current_rank, best_rank):
 
 def best_wild_hand(hand):
     """best_hand но с джокерами"""
-    return
+    hand = parse_hand(hand)
+    # каждый джокер заменяем на любую карту своего цвета,
+    # которой еще нет в руке
+    options = []
+    for card in map(get_card, hand):
+        if card.rank != '?':
+            options.append([card.id])
+            continue
+        colors = 'CS' if card.suit == 'B' else 'HD'
+        options.append([
+            el.id for el in DECK
+            if el.suit in colors and el.id not in hand
+        ])
+
+    best_rank = None
+    best_combination = None
+    for cards in product(*options):
+        if len(set(cards)) < len(cards):
+            continue
+        combination = best_hand(cards)
+        current_rank = hand_rank(combination)
+        if best_combination is None or compare(current_rank, best_rank):
+            best_rank = current_rank
+            best_combination = combination
+    return best_combination
 
 
 def jocker_in(hand):
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+'''
+Correctness harness and benchmark for poker.py
+
+- exhaustive: rank all 2,598,960 five-card hands and compare
+  the number of hands in every category with the known totals
+- crosscheck: compare an evaluator with the reference hand_rank
+  on random 7-card hands
+- bench: measure hands/sec for hand_rank, best_hand and
+  best_wild_hand and save the numbers to a JSON file
+
+Usage:
+$ python3 poker_bench.py [--skip-exhaustive] [--samples N] [--seed N]
+                         [--repeat N] [--min-time SECONDS]
+                         [--output <path_to_json>]
+'''
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from itertools import combinations
+from typing import Callable
+
+# internal
+from poker import DECK, best_hand, best_wild_hand, hand_rank, parse_hand
+
+
+# number of five-card hands in every hand_rank category
+CATEGORY_TOTALS = {
+    8: 40,        # straight flush
+    7: 624,       # four of a kind
+    6: 3744,      # full house
+    5: 5108,      # flush
+    4: 10200,     # straight
+    3: 54912,     # three of a kind
+    2: 123552,    # two pair
+    1: 1098240,   # one pair
+    0: 1302540,   # high card
+}
+
+# ids of the regular cards, jokers excluded
+CARDS = tuple(card.id for card in DECK if card.rank != '?')
+
+
+def count_categories(evaluator: Callable = hand_rank,
+                     cards: tuple = CARDS) -> dict:
+    '''
+    Rank every five-card hand made of given cards
+    and count hands in each category
+    '''
+    counter = Counter(
+        evaluator(hand)[0] for hand in combinations(cards, 5)
+    )
+    return dict(counter)
+
+
+def check_categories(counts: dict) -> list[str]:
+    '''
+    Compare category counts with CATEGORY_TOTALS,
+    return a list of mismatches (empty if everything is fine)
+    '''
+    errors = []
+    for category, total in CATEGORY_TOTALS.items():
+        found = counts.get(category, 0)
+        if found != total:
+            errors.append(
+                f'category {category}: expected {total}, got {found}'
+            )
+    return errors
+
+
+def random_hands(samples: int, size: int = 7,
+                 seed: int = None) -> list[tuple[int]]:
+    '''
+    Deal random hands of given size, as tuples of card ids
+    '''
+    rnd = random.Random(seed)
+    return [tuple(rnd.sample(CARDS, size)) for _ in range(samples)]
+
+
+def crosscheck(evaluator: Callable, hands: list,
+               reference: Callable = hand_rank) -> list[tuple]:
+    '''
+    Pick the best five cards of every hand with both evaluators
+    and compare their reference ranks. Evaluator should accept
+    five card ids and return an orderable value.
+    Return a list of hands where evaluators disagree.
+    '''
+    mismatches = []
+    for hand in hands:
+        expected = max(combinations(hand, 5), key=reference)
+        got = max(combinations(hand, 5), key=evaluator)
+        if reference(got) != reference(expected):
+            mismatches.append(hand)
+    return mismatches
+
+
+def check_best_hand(hands: list,
+                    reference: Callable = hand_rank) -> list[tuple]:
+    '''
+    Make sure best_hand picks five cards with the highest
+    reference rank. Return a list of hands where it does not.
+    '''
+    mismatches = []
+    for hand in hands:
+        expected = max(map(reference, combinations(hand, 5)))
+        if reference(best_hand(hand)) != expected:
+            mismatches.append(hand)
+    return mismatches
+
+
+def bench(fn: Callable, hands: list,
+          repeat: int = 5, min_time: float = 0.2) -> dict:
+    '''
+    Measure throughput of fn over given hands. After a warm-up pass
+    the hands are looped over until min_time seconds have passed,
+    this is repeated several times and the best and median rates
+    are reported (the best one is the least disturbed by the system)
+    '''
+    for hand in hands:
+        fn(hand)
+
+    timings = []
+    for _ in range(repeat):
+        loops = 0
+        start = time.perf_counter()
+        while True:
+            for hand in hands:
+                fn(hand)
+            loops += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        timings.append(elapsed / loops)
+
+    best = min(timings)
+    median = statistics.median(timings)
+    return dict(
+        hands=len(hands),
+        repeat=repeat,
+        seconds_best=round(best, 5),
+        seconds_median=round(median, 5),
+        hands_per_sec=round(len(hands) / best, 1) if best else None,
+        hands_per_sec_median=(
+            round(len(hands) / median, 1) if median else None
+        )
+    )
+
+
+def git_commit() -> str or None:
+    '''
+    Current git commit of the working tree, with "-dirty" suffix
+    if there are uncommitted changes; None outside of git
+    '''
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + '-dirty' if status else commit
+
+
+def wild_hands(hands: list, seed: int = None) -> list[tuple[int]]:
+    '''
+    Replace one card of every hand with a random joker
+    '''
+    rnd = random.Random(seed)
+    jokers = parse_hand(['?B', '?R'])
+    return [hand[:-1] + (rnd.choice(jokers),) for hand in hands]
+
+
+def main(args: argparse.Namespace) -> int:
+    results = dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        commit=git_commit()
+    )
+    failed = False
+
+    if not args.skip_exhaustive:
+        print('Ranking all five-card hands, please wait...')
+        start = time.perf_counter()
+        counts = count_categories()
+        errors = check_categories(counts)
+        results['exhaustive'] = dict(
+            counts={str(k): v for k, v in sorted(counts.items())},
+            seconds=round(time.perf_counter() - start, 5),
+            errors=errors
+        )
+        for error in errors:
+            print(f'FAIL {error}')
+        failed = failed or bool(errors)
+
+    hands = random_hands(args.samples, seed=args.seed)
+    # cross-checking the reference evaluator against itself
+    # with string cards makes sure the parsing path agrees
+    # with the card id one
+    mismatches = crosscheck(
+        lambda hand: hand_rank([repr(DECK[card]) for card in hand]),
+        hands
+    )
+    best_hand_mismatches = check_best_hand(hands)
+    results['crosscheck'] = dict(
+        samples=len(hands),
+        mismatches=len(mismatches),
+        best_hand_mismatches=len(best_hand_mismatches)
+    )
+    if mismatches:
+        print(f'FAIL crosscheck: {len(mismatches)} mismatches')
+        failed = True
+    if best_hand_mismatches:
+        print(f'FAIL best_hand: {len(best_hand_mismatches)} mismatches')
+        failed = True
+
+    five_card_hands = [hand[:5] for hand in hands]
+    timing = dict(repeat=args.repeat, min_time=args.min_time)
+    results['bench'] = dict(
+        hand_rank=bench(hand_rank, five_card_hands, **timing),
+        best_hand=bench(best_hand, hands, **timing),
+        best_wild_hand=bench(
+            best_wild_hand,
+            wild_hands(hands[:args.wild_samples], seed=args.seed),
+            **timing
+        )
+    )
+    for name, numbers in results['bench'].items():
+        print(f'{name}: {numbers["hands_per_sec"]} hands/sec')
+
+    with open(args.output, mode='w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f'Results saved to {args.output}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--skip-exhaustive', help='Do not rank all five-card hands',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--samples', help='Random 7-card hands to check and benchmark',
+        type=int, default=10000
+    )
+    parser.add_argument(
+        '--wild-samples', help='Random hands with a joker to benchmark',
+        type=int, default=100
+    )
+    parser.add_argument(
+        '--seed', help='Random seed', type=int, default=42
+    )
+    parser.add_argument(
+        '--repeat', help='Timing runs per function, best one is reported',
+        type=int, default=5
+    )
+    parser.add_argument(
+        '--min-time', help='Minimum duration of a timing run, seconds',
+        type=float, default=0.2
+    )
+    parser.add_argument(
+        '-o', '--output', help='JSON file to save results',
+        default='./poker_bench.json'
+    )
+    args = parser.parse_args()
+    sys.exit(main(args))
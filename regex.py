@@ -1,6 +1,7 @@
 '''
 Compiled regular expression to parse log line by line.
-Supports two named groups:
+Supports three named groups:
+- time_local (i.e. 29/Jun/2017:10:46:03 +0300)
 - href (the URL)
 - time (request time)
 
@@ -28,7 +29,7 @@ LOG_RECORD_RE = re.compile(
     r'\S+ '
 
     # time_local [datetime tz] i.e. [29/Jun/2017:10:46:03 +0300]
-    r'\[\S+ \S+\] '
+    r'\[(?P<time_local>\S+ \S+)\] '
 
     # request "method href proto" i.e. "GET /api/v2/banner/23815685 HTTP/1.1"
     r'"\S+ (?P<href>\S+) \S+" '
@@ -1,13 +1,21 @@
 # PSL
 import unittest
 from datetime import datetime
+import gzip
 import os
+import tempfile
 
 # internal modules
 from log_analyzer import (load_conf, merge_configs, get_latest_log_info,
                           get_log_records, create_report, render_template,
-                          parse_log_record)
+                          parse_log_record, sample_log_records,
+                          describe_sample, HyperLogLog, QuantileSketch,
+                          create_series, time_bucket)
 from log_analyzer import config
+from poker import (DECK, card_id, card_ranks, hand_rank, straight,
+                   two_pair, best_hand, best_wild_hand)
+from poker_bench import (count_categories, check_categories,
+                         random_hands, crosscheck)
 
 
 class UnitTests(unittest.TestCase):
@@ -67,6 +75,7 @@ class UnitTests(unittest.TestCase):
         self.assertTrue(rec)
         self.assertEqual(rec.href, '/api/1/banners/?campaign=2765576')
         self.assertEqual(rec.request_time, '0.216')
+        self.assertEqual(rec.time_local, '29/Jun/2017:03:50:25 +0300')
 
     def test_log_reader_functionality(self):
         latest_file = self.fixture_file_to_parse
@@ -92,3 +101,190 @@ class UnitTests(unittest.TestCase):
             )
         self.assertTrue(
             os.path.isfile(self.fixture_report_path))
+
+    def test_time_bucket(self):
+        self.assertEqual(
+            time_bucket('29/Jun/2017:10:46:03 +0300', 'minute'),
+            '2017-06-29T10:46:00+03:00')
+        self.assertEqual(
+            time_bucket('29/Jun/2017:10:46:03 +0300', 'hour'),
+            '2017-06-29T10:00:00+03:00')
+
+    def test_quantile_sketch(self):
+        sketch = QuantileSketch()
+        for i in range(1, 1001):
+            sketch.add(i / 1000)
+        self.assertEqual(sketch.count, 1000)
+        self.assertAlmostEqual(sketch.quantile(0.5), 0.5, delta=0.01)
+        self.assertAlmostEqual(sketch.quantile(0.99), 0.99, delta=0.02)
+
+    def test_create_series(self):
+        records = get_log_records(self.fixture_file_to_parse)
+        report = create_report(records, max_records=1000)
+        urls = [row['url'] for row in report[:3]]
+        series = create_series(records, urls, bucket='minute')
+        self.assertEqual([row['url'] for row in series][:1], urls[:1])
+        for row in report[:3]:
+            self.assertEqual(
+                sum(s['count'] for s in series if s['url'] == row['url']),
+                row['count'])
+        with self.assertRaises(ValueError):
+            create_series(records, urls, bucket='day')
+
+    def test_hyperloglog(self):
+        hrefs = HyperLogLog()
+        for i in range(20000):
+            hrefs.add(f'/api/v2/banner/{i}')
+            hrefs.add(f'/api/v2/banner/{i}')
+        self.assertAlmostEqual(len(hrefs), 20000, delta=1000)
+
+    def test_sample_every_line(self):
+        sample = sample_log_records(
+            self.fixture_file_to_parse, sample_size=None, sample_step=1)
+        self.assertEqual(sample.lines, 16)
+        self.assertEqual(sample.total_lines, 16)
+        self.assertTrue(sample.unique_in_log)
+        self.assertEqual(sample.unique_hrefs, len(
+            {rec.href for rec in get_log_records(
+                self.fixture_file_to_parse)}))
+        full_report = create_report(
+            get_log_records(self.fixture_file_to_parse), max_records=1000)
+        report = create_report(
+            sample.records, max_records=1000, sample=sample)
+        self.assertEqual(len(report[-1].keys()), 10)
+        for row, full_row in zip(report, full_report):
+            self.assertEqual(row['count'], full_row['count'])
+            self.assertEqual(row['count_err'], 0)
+            self.assertEqual(row['time_sum_err'], 0)
+
+    def test_sample_random_offsets(self):
+        sample = sample_log_records(
+            self.fixture_file_to_parse, sample_size=1000, seed=1)
+        # offsets are drawn with replacement, so lines repeat
+        self.assertEqual(sample.lines, 1000)
+        self.assertEqual(len(sample.records), 1000)
+        self.assertAlmostEqual(sample.total_lines, 16, delta=1)
+        self.assertFalse(sample.unique_in_log)
+        self.assertIn('at least', describe_sample(sample))
+
+    def test_sample_empty_log(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, 'nginx-access-ui.log.gz')
+            with gzip.open(log_path, mode='wb'):
+                pass
+            for sample_size in (None, 1000):
+                sample = sample_log_records(
+                    log_path, sample_size=sample_size)
+                self.assertEqual(sample.lines, 0)
+                self.assertEqual(sample.total_lines, 0)
+                self.assertEqual(
+                    create_report(sample.records, 1000, sample=sample), [])
+                self.assertIn('APPROXIMATE', describe_sample(sample))
+
+    def test_sample_bytes_budget(self):
+        with open(self.fixture_file_to_parse) as log_file:
+            lines = log_file.readlines()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, 'nginx-access-ui.log')
+            with open(log_path, mode='w') as log_file:
+                log_file.writelines(lines * 1250)
+            sample = sample_log_records(
+                log_path, sample_size=None, sample_step=10,
+                sample_bytes=os.path.getsize(log_path) // 4)
+        self.assertLess(sample.read_share, 0.35)
+        self.assertAlmostEqual(sample.total_lines, 20000, delta=1000)
+        self.assertFalse(sample.unique_in_log)
+        self.assertIn('first', describe_sample(sample))
+
+    def test_sample_uneven_lines(self):
+        with open(self.fixture_file_to_parse) as log_file:
+            lines = log_file.readlines()
+        # a long line is always followed by a short one, so picking
+        # the line after a random offset would favour the short ones
+        long_line = lines[0].replace(
+            '"-" "-" "-"', '"-" "{}" "-"'.format('x' * 2000), 1)
+        short_line = lines[2]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = os.path.join(tmp_dir, 'nginx-access-ui.log')
+            with open(log_path, mode='w') as log_file:
+                log_file.writelines([long_line, short_line] * 5000)
+            sample = sample_log_records(
+                log_path, sample_size=5000, seed=1)
+        self.assertAlmostEqual(sample.total_lines, 10000, delta=500)
+
+        true_rows = {
+            parse_log_record(line).href: parse_log_record(line)
+            for line in (long_line, short_line)
+        }
+        report = create_report(
+            sample.records, max_records=1000, sample=sample)
+        self.assertEqual(len(report), 2)
+        for row in report:
+            request_time = float(true_rows[row['url']].request_time)
+            self.assertLess(row['count_err'], 1000)
+            self.assertLessEqual(abs(row['count'] - 5000), row['count_err'])
+            self.assertLessEqual(
+                abs(row['time_sum'] - 5000 * request_time),
+                row['time_sum_err'] + 0.001)
+
+    def test_sample_every_nth_line(self):
+        sample = sample_log_records(
+            self.fixture_file_to_parse, sample_size=None, sample_step=4)
+        self.assertEqual(sample.lines, 4)
+        self.assertEqual(sample.total_lines, 16)
+
+
+class PokerUnitTests(unittest.TestCase):
+
+    def test_card_parsing(self):
+        self.assertEqual(len(DECK), 54)
+        self.assertIs(DECK[card_id('TH')], DECK[card_id('TH')])
+        self.assertEqual(repr(DECK[card_id('AS')]), 'AS')
+        self.assertEqual(DECK[card_id('AS')].ranknum, 14)
+        self.assertEqual(repr(DECK[card_id('?R')]), '?R')
+
+    def test_hand_rank_accepts_ids(self):
+        hand = '6C 7C 8C 9C TC'.split()
+        ids = [card_id(card) for card in hand]
+        self.assertEqual(hand_rank(ids), hand_rank(hand))
+        self.assertEqual(hand_rank(ids), (8, 10))
+
+    def test_wheel_straight(self):
+        self.assertTrue(straight([14, 5, 4, 3, 2]))
+        self.assertEqual(card_ranks('AC 2D 3H 4S 5C'.split()),
+                         [5, 4, 3, 2, 1])
+        self.assertEqual(hand_rank('AC 2D 3H 4S 5C'.split()), (4, 5))
+
+    def test_two_pair_keeps_input(self):
+        ranks = [10, 10, 8, 8, 3]
+        self.assertEqual(two_pair(ranks), (10, 8))
+        self.assertEqual(ranks, [10, 10, 8, 8, 3])
+        self.assertEqual(
+            hand_rank('TC TD 8C 8D 3S'.split()), (2, (10, 8), ranks))
+
+    def test_best_hand_high_card(self):
+        self.assertEqual(
+            sorted(best_hand('2C 4D 6H 8S TC QD AH'.split())),
+            ['6H', '8S', 'AH', 'QD', 'TC'])
+
+    def test_best_wild_hand(self):
+        self.assertEqual(
+            sorted(best_wild_hand('6C 7C 8C 9C TC 5C ?B'.split())),
+            ['7C', '8C', '9C', 'JC', 'TC'])
+        self.assertEqual(
+            sorted(best_wild_hand('TD TC 5H 5C 7C ?R ?B'.split())),
+            ['7C', 'TC', 'TD', 'TH', 'TS'])
+
+    def test_harness_categories(self):
+        # one full suit: every hand is a flush, 10 of them are
+        # straight flushes (A-2-3-4-5 up to T-J-Q-K-A)
+        cards = tuple(card_id(f'{rank}C') for rank in '23456789TJQKA')
+        counts = count_categories(cards=cards)
+        self.assertEqual(counts, {8: 10, 5: 1277})
+        self.assertTrue(check_categories(counts))
+
+    def test_harness_crosscheck(self):
+        hands = random_hands(20, seed=1)
+        self.assertFalse(crosscheck(hand_rank, hands))
+        self.assertTrue(
+            crosscheck(lambda hand: -hand_rank(hand)[0], hands))